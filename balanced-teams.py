@@ -2,7 +2,10 @@ import itertools
 import random
 import matplotlib.pyplot as plt
 import math
-from copy import deepcopy # Might be needed for complex assignments
+import heapq
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
 
 # --- Player Data ---
 players_data = [
@@ -25,104 +28,298 @@ players_data = [
 # --- Configuration ---
 NUM_SIMULATIONS_TO_SHOW = 5 # How many top results to display
 TARGET_FIELD_FORMATION = {'ATT': 3, 'DEF': 3} # 3 attackers, 3 defenders
+LARGE_ROSTER_COMBINATIONS = 100_000 # Above this, use the Numba kernel (if installed) or branch-and-bound
+
+# Integer position codes used by the vectorized combination scoring
+POS_ATT, POS_DEF, POS_FLEX, POS_GK = 0, 1, 2, 3
+_POS_MAP = {'ATT': POS_ATT, 'DEF': POS_DEF, 'ATT/DEF': POS_FLEX, 'GK': POS_GK}
+_POS_NAMES = ('ATT', 'DEF', 'ATT/DEF', 'GK') # Indexed by position code
+
+# --- Player Records ---
+# position is kept for printing; everything else compares the integer pos_code
+Player = namedtuple('Player', 'name strength position pos_code is_goalkeeper')
+
+def _make_player(record):
+    pos_code = _POS_MAP[record['position']]
+    return Player(**record, pos_code=pos_code, is_goalkeeper=(pos_code == POS_GK))
+
+players_data = [_make_player(p) for p in players_data]
+
+# --- Struct-of-Arrays view of players_data ---
+# Teams are handled as arrays of indices into these parallel arrays
+names = np.asarray([p.name for p in players_data])
+strengths = np.asarray([p.strength for p in players_data], dtype=np.int8)
+positions_code = np.asarray([p.pos_code for p in players_data], dtype=np.int8)
+is_gk = np.asarray([p.is_goalkeeper for p in players_data])
+# The roster total never changes: Team B strength = TOTAL_STRENGTH - Team A strength
+TOTAL_STRENGTH = int(strengths.sum())
+
+# --- Pitch Layout ---
+# Field dimensions (simple representation)
+PITCH_LENGTH = 100
+PITCH_WIDTH = 60
+CENTER_SPOT = (PITCH_WIDTH / 2, PITCH_LENGTH / 2)
+GOAL_AREA_SIZE = (PITCH_WIDTH * 0.4, PITCH_LENGTH * 0.1)
+GOAL_AREA_CORNERS = ((PITCH_WIDTH * 0.3, 0), (PITCH_WIDTH * 0.3, PITCH_LENGTH * 0.9))
+
+# Formation Coordinates (approximate)
+# Team A (bottom half)
+COORDS_A = {
+    'GK': ((PITCH_WIDTH / 2, PITCH_LENGTH * 0.05),),
+    'DEF': ((PITCH_WIDTH * 0.2, PITCH_LENGTH * 0.25),
+            (PITCH_WIDTH / 2, PITCH_LENGTH * 0.25),
+            (PITCH_WIDTH * 0.8, PITCH_LENGTH * 0.25)),
+    'ATT': ((PITCH_WIDTH * 0.25, PITCH_LENGTH * 0.4),
+            (PITCH_WIDTH / 2, PITCH_LENGTH * 0.45),
+            (PITCH_WIDTH * 0.75, PITCH_LENGTH * 0.4)),
+}
+# Team B (top half)
+COORDS_B = {
+    'GK': ((PITCH_WIDTH / 2, PITCH_LENGTH * 0.95),),
+    'DEF': ((PITCH_WIDTH * 0.2, PITCH_LENGTH * 0.75),
+            (PITCH_WIDTH / 2, PITCH_LENGTH * 0.75),
+            (PITCH_WIDTH * 0.8, PITCH_LENGTH * 0.75)),
+    'ATT': ((PITCH_WIDTH * 0.25, PITCH_LENGTH * 0.6),
+            (PITCH_WIDTH / 2, PITCH_LENGTH * 0.55),
+            (PITCH_WIDTH * 0.75, PITCH_LENGTH * 0.6)),
+}
+
+# One viable split. Compares as a plain tuple: by difference, then enumeration rank.
+TeamConfig = namedtuple('TeamConfig', 'difference rank mask_a strength_a strength_b')
 
 # --- Helper Functions ---
-def get_team_strength(team):
-    """Calculates the total strength of a list of players."""
-    return sum(player['strength'] for player in team)
+def team_from_mask(mask):
+    """Returns the player indices set in a roster bitmask, in roster order."""
+    return [i for i in range(len(players_data)) if mask >> i & 1]
 
 def format_team(team):
-    """Formats a team list for printing."""
-    return ", ".join(f"{p['name']} ({p['strength']}-{p['position']})"
-                     for p in sorted(team, key=lambda x: x['name']))
+    """Formats a team (array of player indices) for printing."""
+    return ", ".join(f"{names[i]} ({strengths[i]}-{_POS_NAMES[positions_code[i]]})"
+                     for i in sorted(team, key=names.__getitem__))
 
-def check_positional_viability(team, target_formation):
+def formation_viable(pure_att, pure_def, flexible, target_formation):
     """
-    Checks if a team *can* field the target number of attackers and defenders,
-    using flexible players where needed. Excludes the GK.
+    Checks viability from the per-role player counts of a team (GK excluded).
+    Works elementwise on NumPy arrays, so every combination is checked at once.
     """
-    field_players = [p for p in team if p['position'] != 'GK']
     target_att = target_formation.get('ATT', 0)
     target_def = target_formation.get('DEF', 0)
     target_total_field = target_att + target_def
 
-    if len(field_players) != target_total_field:
-        # print(f"Warning: Team size mismatch. Expected {target_total_field} field players, got {len(field_players)}")
-        return False # Or handle differently if variable team sizes are allowed
-
-    pure_att = sum(1 for p in field_players if p['position'] == 'ATT')
-    pure_def = sum(1 for p in field_players if p['position'] == 'DEF')
-    flexible = sum(1 for p in field_players if p['position'] == 'ATT/DEF')
+    # Variable team sizes are not supported
+    size_ok = (pure_att + pure_def + flexible) == target_total_field
 
     # Can we reach the target number of attackers?
     min_possible_att = pure_att
     max_possible_att = pure_att + flexible
-    att_possible = (min_possible_att <= target_att <= max_possible_att)
+    att_possible = (min_possible_att <= target_att) & (target_att <= max_possible_att)
 
     # Can we reach the target number of defenders?
     min_possible_def = pure_def
     max_possible_def = pure_def + flexible
-    def_possible = (min_possible_def <= target_def <= max_possible_def)
+    def_possible = (min_possible_def <= target_def) & (target_def <= max_possible_def)
 
     # Crucially, ensure the flexible players aren't double-counted beyond their limit
-    needed_att_from_flex = max(0, target_att - pure_att)
-    needed_def_from_flex = max(0, target_def - pure_def)
+    needed_att_from_flex = np.maximum(0, target_att - pure_att)
+    needed_def_from_flex = np.maximum(0, target_def - pure_def)
 
     total_flex_needed = needed_att_from_flex + needed_def_from_flex
 
-    return att_possible and def_possible and (total_flex_needed <= flexible)
+    return size_ok & att_possible & def_possible & (total_flex_needed <= flexible)
+
+
+def branch_and_bound(strengths, positions, k, gk_strength, total, keep, target_formation):
+    """
+    Depth-first search over Team A subsets of field players, pruning every branch whose
+    best achievable balance difference is worse than the `keep`-th best viable one so far.
+    Returns the surviving subsets as an (M, k) index array, in itertools.combinations order.
+    """
+    n = len(strengths)
+    order = sorted(range(n), key=strengths.__getitem__, reverse=True) # Strongest first
+    sorted_strengths = [int(strengths[i]) for i in order]
+    sorted_positions = [int(positions[i]) for i in order]
+    # prefix_sums[i] = sum of the i strongest players
+    prefix_sums = list(itertools.accumulate(sorted_strengths, initial=0))
+    total_counts = [sorted_positions.count(code) for code in (POS_ATT, POS_DEF, POS_FLEX)]
+    target_att = target_formation.get('ATT', 0)
+    target_def = target_formation.get('DEF', 0)
+
+    @lru_cache(maxsize=None)
+    def viable_counts(pure_att, pure_def, flexible):
+        # The answer only depends on the counts, so each distinct tuple is checked once
+        return _viable_counts(pure_att, pure_def, flexible, target_att, target_def)
+
+    best_diffs = [] # Max-heap (negated) of the `keep` smallest viable differences
+    picked = []
+    counts = [0, 0, 0] # ATT, DEF, FLEX among the picked players
+    survivors = []
+
+    def choose(i, partial_sum):
+        remaining = k - len(picked)
+        if remaining == 0:
+            survivors.append(sorted(order[j] for j in picked))
+            viable = (viable_counts(*counts)
+                      and viable_counts(*(t - c for t, c in zip(total_counts, counts))))
+            if viable:
+                difference = abs(2 * partial_sum - total)
+                if len(best_diffs) < keep:
+                    heapq.heappush(best_diffs, -difference)
+                elif difference < -best_diffs[0]:
+                    heapq.heapreplace(best_diffs, -difference)
+            return
+        if n - i < remaining:
+            return
+
+        if len(best_diffs) == keep:
+            # The remaining picks add at least the `remaining` weakest and at most
+            # the `remaining` strongest of players i.. (sorted descending)
+            low = 2 * (partial_sum + prefix_sums[n] - prefix_sums[n - remaining]) - total
+            high = 2 * (partial_sum + prefix_sums[i + remaining] - prefix_sums[i]) - total
+            bound = low if low > 0 else (-high if high < 0 else 0)
+            if bound > -best_diffs[0]:
+                return
+
+        # Branch 1: player i goes to Team A
+        picked.append(i)
+        counts[sorted_positions[i]] += 1
+        choose(i + 1, partial_sum + sorted_strengths[i])
+        counts[sorted_positions[i]] -= 1
+        picked.pop()
+        # Branch 2: player i stays out
+        choose(i + 1, partial_sum)
+
+    choose(0, gk_strength)
+
+    combo_idx = np.array(survivors, dtype=np.int32).reshape(-1, k)
+    return combo_idx[np.lexsort(combo_idx.T[::-1])]
+
+def _enumerate_masks(n, k):
+    """
+    Returns every n-bit mask with k bits set, in decreasing order (Gosper's hack).
+    Reading bit n-1-i as player i, this is itertools.combinations order.
+    """
+    num_combos = 1
+    for i in range(k):
+        num_combos = num_combos * (n - i) // (i + 1)
+    masks = np.empty(num_combos, dtype=np.int64)
+
+    mask = (1 << k) - 1
+    for c in range(num_combos):
+        masks[num_combos - 1 - c] = mask
+        # Next larger integer with the same number of set bits
+        lowest = mask & -mask
+        ripple = mask + lowest
+        mask = (((ripple ^ mask) >> 2) // lowest) | ripple
+    return masks
+
+def _viable_counts(pure_att, pure_def, flexible, target_att, target_def):
+    """Scalar version of formation_viable(), used by branch_and_bound() and the Numba kernel."""
+    if pure_att + pure_def + flexible != target_att + target_def:
+        return False
+    if pure_att > target_att or pure_def > target_def:
+        return False
+    return max(0, target_att - pure_att) + max(0, target_def - pure_def) <= flexible
+
+def load_numba_kernel():
+    """
+    Compiles the large-roster scoring kernel, or returns None if Numba is not installed.
+    Numba is only imported here, so small rosters never pay for the import.
+    """
+    try:
+        from numba import njit, prange
+    except ImportError: # Numba is optional, only used for large rosters
+        return None
+
+    enumerate_masks = njit(cache=True)(_enumerate_masks)
+    viable_counts = njit(cache=True)(_viable_counts)
+
+    @njit(cache=True, parallel=True)
+    def score_all(strengths, positions, player_ids, k, gk_id, gk_strength, total, target_att, target_def):
+        """
+        Numba kernel scoring every k-subset of field players as Team A.
+        The subset masks are enumerated serially, then scored in parallel across cores.
+        Returns (roster_masks, strengths_a, differences, viable) arrays, one entry per subset in
+        itertools.combinations order, so ties rank the same as on the NumPy path.
+        roster_masks are Team A over the whole roster: bit player_ids[i] per field player, plus gk_id.
+        """
+        n = len(strengths)
+        masks = enumerate_masks(n, k)
+        num_combos = len(masks)
+        # One output slot per combination, so threads never write to the same element
+        strengths_a = np.empty(num_combos, dtype=np.int64)
+        differences = np.empty(num_combos, dtype=np.int64)
+        viable = np.empty(num_combos, dtype=np.bool_)
+
+        total_att = total_def = total_flex = 0
+        for i in range(n):
+            total_att += positions[i] == POS_ATT
+            total_def += positions[i] == POS_DEF
+            total_flex += positions[i] == POS_FLEX
+
+        roster_masks = np.empty(num_combos, dtype=np.int64)
+        for c in prange(num_combos):
+            mask = masks[c]
+            roster_mask = 1 << gk_id
+            strength_a = gk_strength
+            att_a = def_a = flex_a = 0
+            for i in range(n):
+                if (mask >> (n - 1 - i)) & 1:
+                    roster_mask |= 1 << player_ids[i]
+                    strength_a += strengths[i]
+                    att_a += positions[i] == POS_ATT
+                    def_a += positions[i] == POS_DEF
+                    flex_a += positions[i] == POS_FLEX
+            roster_masks[c] = roster_mask
+            strengths_a[c] = strength_a
+            differences[c] = abs(2 * strength_a - total)
+            viable[c] = (viable_counts(att_a, def_a, flex_a, target_att, target_def)
+                         and viable_counts(total_att - att_a, total_def - def_a,
+                                           total_flex - flex_a, target_att, target_def))
+
+        return roster_masks, strengths_a, differences, viable
+
+    return score_all
 
 
 def assign_positions_for_plot(team, target_formation):
     """
     Assigns players to specific ATT/DEF slots for plotting, prioritizing pure roles.
-    Returns a dictionary: {'GK': [player], 'DEF': [players], 'ATT': [players]}
+    Returns a dictionary of player indices: {'GK': [idx], 'DEF': [idx, ...], 'ATT': [idx, ...]}
     """
     assignment = {'GK': [], 'DEF': [], 'ATT': []}
     field_players = sorted(
-        [p for p in team if p['position'] != 'GK'],
-        key=lambda x: x['strength'], reverse=True # Assign stronger players first potentially
+        [i for i in team if not is_gk[i]],
+        key=strengths.__getitem__, reverse=True # Assign stronger players first potentially
     )
-    gk = [p for p in team if p['position'] == 'GK']
+    gk = [i for i in team if is_gk[i]]
     assignment['GK'] = gk
 
     target_att = target_formation.get('ATT', 0)
     target_def = target_formation.get('DEF', 0)
 
-    assigned_names = set()
-
-    # 1. Assign pure DEF
-    pure_defs = [p for p in field_players if p['position'] == 'DEF']
-    for p in pure_defs:
-        if len(assignment['DEF']) < target_def:
-            assignment['DEF'].append(p)
-            assigned_names.add(p['name'])
-
-    # 2. Assign pure ATT
-    pure_atts = [p for p in field_players if p['position'] == 'ATT']
-    for p in pure_atts:
-        if len(assignment['ATT']) < target_att:
-            assignment['ATT'].append(p)
-            assigned_names.add(p['name'])
-
-    # 3. Assign flexible players (ATT/DEF)
-    flexible_players = [p for p in field_players if p['position'] == 'ATT/DEF']
-    # Fill remaining DEF slots
-    for p in flexible_players:
-        if p['name'] not in assigned_names and len(assignment['DEF']) < target_def:
-            assignment['DEF'].append(p)
-            assigned_names.add(p['name'])
-    # Fill remaining ATT slots
-    for p in flexible_players:
-         if p['name'] not in assigned_names and len(assignment['ATT']) < target_att:
-            assignment['ATT'].append(p)
-            assigned_names.add(p['name'])
+    # Classify once into pure defenders, pure attackers and flexible players (strongest first)
+    pure_defs, pure_atts, flexible_players = [], [], []
+    buckets = {POS_DEF: pure_defs, POS_ATT: pure_atts, POS_FLEX: flexible_players}
+    for i in field_players:
+        buckets[positions_code[i]].append(i)
+
+    # 1. Assign pure DEF, 2. Assign pure ATT
+    assignment['DEF'] = pure_defs[:target_def]
+    assignment['ATT'] = pure_atts[:target_att]
+
+    # 3. Assign flexible players (ATT/DEF): fill remaining DEF slots, then remaining ATT slots
+    flex_to_def = target_def - len(assignment['DEF'])
+    flex_to_att = target_att - len(assignment['ATT'])
+    assignment['DEF'] += flexible_players[:flex_to_def]
+    assignment['ATT'] += flexible_players[flex_to_def:flex_to_def + flex_to_att]
+    flex_used = min(len(flexible_players), flex_to_def + flex_to_att)
 
     # Sanity check - if logic is correct and viable, counts should match
     if len(assignment['ATT']) != target_att or len(assignment['DEF']) != target_def:
          print(f"Warning: Could not assign exact formation for team: {format_team(team)}")
          # Fallback: just put remaining players somewhere if lists are short
-         remaining = [p for p in field_players if p['name'] not in assigned_names]
+         remaining = sorted(pure_defs[target_def:] + pure_atts[target_att:] + flexible_players[flex_used:],
+                            key=field_players.index)
          while len(assignment['DEF']) < target_def and remaining:
              assignment['DEF'].append(remaining.pop(0))
          while len(assignment['ATT']) < target_att and remaining:
@@ -132,53 +329,31 @@ def assign_positions_for_plot(team, target_formation):
     return assignment
 
 
-def plot_formation(team_a_assigned, team_b_assigned, config):
-    """Plots the two teams on a pitch representation."""
-    fig, ax = plt.subplots(figsize=(7, 10))
-
-    # Field dimensions (simple representation)
-    pitch_length = 100
-    pitch_width = 60
-    ax.set_xlim(0, pitch_width)
-    ax.set_ylim(0, pitch_length)
+def _draw_pitch(ax):
+    """Sets up the axis limits and draws the basic pitch markings."""
+    ax.set_xlim(0, PITCH_WIDTH)
+    ax.set_ylim(0, PITCH_LENGTH)
     ax.set_xticks([])
     ax.set_yticks([])
 
-    # Pitch markings (basic)
-    ax.plot([0, pitch_width], [pitch_length / 2, pitch_length / 2], color="grey", linestyle="--") # Halfway line
-    center_circle = plt.Circle((pitch_width / 2, pitch_length / 2), radius=10, fill=False, color="grey")
-    ax.add_patch(center_circle)
+    # Pitch markings (basic); patches belong to one figure, so they are created per call
+    ax.plot([0, PITCH_WIDTH], [PITCH_LENGTH / 2, PITCH_LENGTH / 2], color="grey", linestyle="--") # Halfway line
+    ax.add_patch(plt.Circle(CENTER_SPOT, radius=10, fill=False, color="grey"))
     # Simple Goal areas
-    ax.add_patch(plt.Rectangle((pitch_width*0.3, 0), pitch_width*0.4, pitch_length*0.1, fill=False, color="grey"))
-    ax.add_patch(plt.Rectangle((pitch_width*0.3, pitch_length*0.9), pitch_width*0.4, pitch_length*0.1, fill=False, color="grey"))
-
-
-    # --- Define Formation Coordinates (approximate) ---
-    # Team A (bottom half)
-    coords_a = {
-        'GK': [(pitch_width / 2, pitch_length * 0.05)],
-        'DEF': [(pitch_width * 0.2, pitch_length * 0.25),
-                (pitch_width / 2, pitch_length * 0.25),
-                (pitch_width * 0.8, pitch_length * 0.25)],
-        'ATT': [(pitch_width * 0.25, pitch_length * 0.4),
-                (pitch_width / 2, pitch_length * 0.45),
-                (pitch_width * 0.75, pitch_length * 0.4)]
-    }
-    # Team B (top half)
-    coords_b = {
-        'GK': [(pitch_width / 2, pitch_length * 0.95)],
-        'DEF': [(pitch_width * 0.2, pitch_length * 0.75),
-                (pitch_width / 2, pitch_length * 0.75),
-                (pitch_width * 0.8, pitch_length * 0.75)],
-        'ATT': [(pitch_width * 0.25, pitch_length * 0.6),
-                (pitch_width / 2, pitch_length * 0.55),
-                (pitch_width * 0.75, pitch_length * 0.6)]
-    }
+    for corner in GOAL_AREA_CORNERS:
+        ax.add_patch(plt.Rectangle(corner, *GOAL_AREA_SIZE, fill=False, color="grey"))
+
+
+def plot_formation(team_a_assigned, team_b_assigned, config):
+    """Plots the two teams on a pitch representation."""
+    fig, ax = plt.subplots(figsize=(7, 10))
+
+    _draw_pitch(ax)
 
     # --- Plot Players ---
     teams_data = [
-        {'assigned': team_a_assigned, 'coords': coords_a, 'color': 'blue', 'marker': 'o', 'name': 'Team A'},
-        {'assigned': team_b_assigned, 'coords': coords_b, 'color': 'red', 'marker': 's', 'name': 'Team B'}
+        {'assigned': team_a_assigned, 'coords': COORDS_A, 'color': 'blue', 'marker': 'o', 'name': 'Team A'},
+        {'assigned': team_b_assigned, 'coords': COORDS_B, 'color': 'red', 'marker': 's', 'name': 'Team B'}
     ]
 
     for team_info in teams_data:
@@ -188,6 +363,7 @@ def plot_formation(team_a_assigned, team_b_assigned, config):
         marker = team_info['marker']
         name = team_info['name']
         plotted_count = {'GK': 0, 'DEF': 0, 'ATT': 0}
+        xs, ys, labels = [], [], []
 
         for role in ['GK', 'DEF', 'ATT']:
             players_in_role = assigned.get(role, [])
@@ -195,16 +371,21 @@ def plot_formation(team_a_assigned, team_b_assigned, config):
             for i, player in enumerate(players_in_role):
                 if i < len(available_coords):
                     x, y = available_coords[i]
-                    ax.plot(x, y, marker=marker, color=color, markersize=35, label=f"{name}" if i==0 and role=='GK' else "") # Label once per team
-                    ax.text(x, y, f"{player['name'].split()[0]}\n({player['strength']})",
-                            ha='center', va='center', fontsize=8, color='white', fontweight='bold')
+                    xs.append(x)
+                    ys.append(y)
+                    labels.append(f"{names[player].split()[0]}\n({strengths[player]})")
                     plotted_count[role] += 1
                 else:
                     print(f"Warning: Not enough coordinates defined for role {role} in {name}")
 
+        # One scatter per team (s is in points^2, matching markersize=35)
+        ax.scatter(xs, ys, s=35**2, c=color, marker=marker, label=name, zorder=2)
+        for x, y, label in zip(xs, ys, labels):
+            ax.text(x, y, label, ha='center', va='center', fontsize=8, color='white', fontweight='bold')
+
     ax.legend()
-    plt.title(f"Best Balanced Teams (Diff: {config['difference']})\n"
-              f"Team A (Str: {config['strength_a']}) vs Team B (Str: {config['strength_b']})",
+    plt.title(f"Best Balanced Teams (Diff: {config.difference})\n"
+              f"Team A (Str: {config.strength_a}) vs Team B (Str: {config.strength_b})",
               fontsize=12)
     plt.show()
 
@@ -212,13 +393,9 @@ def plot_formation(team_a_assigned, team_b_assigned, config):
 # --- Main Logic ---
 
 # 1. Prepare Data
-# Add is_goalkeeper flag based on position for consistency
-for p in players_data:
-    p['is_goalkeeper'] = (p['position'] == 'GK')
-
-goalkeepers = [p for p in players_data if p['is_goalkeeper']]
-field_players = [p for p in players_data if not p['is_goalkeeper']]
-all_players_set = set(p['name'] for p in players_data)
+# Player indices split by role (see the Struct-of-Arrays view above)
+goalkeepers = np.flatnonzero(is_gk)
+field_players = np.flatnonzero(~is_gk)
 
 if len(goalkeepers) != 2:
     print("Error: Exactly two goalkeepers are required.")
@@ -241,51 +418,86 @@ if sum(TARGET_FIELD_FORMATION.values()) != field_players_per_team:
 
 
 # Assign goalkeepers (fixed assignment for calculation)
-gk1 = goalkeepers[0]
-gk2 = goalkeepers[1]
+gk1 = int(goalkeepers[0])
+gk2 = int(goalkeepers[1])
 
 # 2. Generate Combinations and Evaluate
-possible_team_configs = []
-
-print(f"Generating combinations for {len(field_players)} field players, choosing {field_players_per_team}...")
-
-for team_a_field_players_tuple in itertools.combinations(field_players, field_players_per_team):
-    team_a_field_players = list(team_a_field_players_tuple)
-    team_a_field_players_names = set(p['name'] for p in team_a_field_players)
-
-    # Determine Team B's field players
-    team_b_field_players = [p for p in field_players if p['name'] not in team_a_field_players_names]
-
-    # Form the complete teams
-    team_a = [gk1] + team_a_field_players
-    team_b = [gk2] + team_b_field_players
-
-    # Calculate strengths
-    strength_a = get_team_strength(team_a)
-    strength_b = get_team_strength(team_b)
-    difference = abs(strength_a - strength_b)
-
-    # Check positional viability
-    viable_a = check_positional_viability(team_a, TARGET_FIELD_FORMATION)
-    viable_b = check_positional_viability(team_b, TARGET_FIELD_FORMATION)
-
-    # Store the result
-    possible_team_configs.append({
-        'team_a': list(team_a), # Store copies
-        'team_b': list(team_b),
-        'strength_a': strength_a,
-        'strength_b': strength_b,
-        'difference': difference,
-        'positionally_viable': viable_a and viable_b # Store if *both* teams are viable
-    })
-
-print(f"Generated {len(possible_team_configs)} total combinations.")
-
-# 3. Filter for Positional Viability and Sort
-viable_configs = [config for config in possible_team_configs if config['positionally_viable']]
-viable_configs.sort(key=lambda x: x['difference']) # Sort by strength difference
-
-print(f"Found {len(viable_configs)} positionally viable combinations (for {TARGET_FIELD_FORMATION} field setup).")
+full_roster_mask = (1 << len(players_data)) - 1
+num_field_players = len(field_players)
+field_strengths = strengths[field_players]
+field_positions = positions_code[field_players]
+
+print(f"Generating combinations for {num_field_players} field players, choosing {field_players_per_team}...")
+
+num_combinations = math.comb(num_field_players, field_players_per_team)
+score_all = load_numba_kernel() if num_combinations >= LARGE_ROSTER_COMBINATIONS else None
+if score_all is not None:
+    # Large roster: enumerate and score every combination in the compiled kernel
+    roster_masks_a, strengths_a, differences, viable = score_all(
+        field_strengths, field_positions, field_players, field_players_per_team, gk1, int(strengths[gk1]),
+        TOTAL_STRENGTH, TARGET_FIELD_FORMATION.get('ATT', 0), TARGET_FIELD_FORMATION.get('DEF', 0))
+else:
+    # One row per combination: the field-player indices that go to Team A
+    if num_combinations >= LARGE_ROSTER_COMBINATIONS:
+        # Too many to materialize: keep only the ones that can still reach the top results
+        combo_idx = branch_and_bound(field_strengths, field_positions, field_players_per_team,
+                                     int(strengths[gk1]), TOTAL_STRENGTH,
+                                     NUM_SIMULATIONS_TO_SHOW * 2, TARGET_FIELD_FORMATION)
+    else:
+        combo_idx = np.array(list(itertools.combinations(range(num_field_players), field_players_per_team)),
+                             dtype=np.int32).reshape(-1, field_players_per_team)
+
+    # Per field player: strength plus one-hot ATT/DEF/FLEX flags, so a single
+    # gather-and-sum gives Team A's strength and position counts together
+    field_features = np.column_stack([field_strengths, field_positions == POS_ATT,
+                                      field_positions == POS_DEF, field_positions == POS_FLEX]).astype(np.int32)
+    sums_a = field_features[combo_idx].sum(axis=1)
+
+    # Strengths for all combinations at once
+    strengths_a = strengths[gk1] + sums_a[:, 0]
+    differences = np.abs(2 * strengths_a - TOTAL_STRENGTH)
+
+    # Positional viability for all combinations at once
+    att_a, def_a, flex_a = sums_a[:, 1:].T
+    # Team B's counts are whatever Team A leaves over
+    att_b, def_b, flex_b = (field_features[:, 1:].sum(axis=0) - sums_a[:, 1:]).T
+    viable = (formation_viable(att_a, def_a, flex_a, TARGET_FIELD_FORMATION)
+              & formation_viable(att_b, def_b, flex_b, TARGET_FIELD_FORMATION))
+
+    # Team A as a bitmask over the whole roster (field players plus its goalkeeper);
+    # Team B is its complement, so the teams themselves are only built for the configs shown
+    roster_masks_a = (1 << gk1) | np.bitwise_or.reduce(
+        np.left_shift(1, field_players[combo_idx], dtype=np.int64), axis=1)
+
+strengths_b = TOTAL_STRENGTH - strengths_a
+
+num_evaluated = len(differences)
+pruned = num_evaluated < num_combinations
+if pruned:
+    print(f"Evaluated {num_evaluated} of {num_combinations} combinations "
+          f"(the other {num_combinations - num_evaluated} were pruned by branch-and-bound).")
+else:
+    print(f"Generated {num_evaluated} total combinations.")
+
+# 3. Filter for Positional Viability and Rank
+# Only the most balanced few are shown: select the viable rows at or below the
+# num_to_keep-th smallest difference (no full sort), rank just those by difference,
+# ties by enumeration order, and build TeamConfig tuples for the top rows only.
+# Twice as many candidates as needed leaves room for the A/B-swap dedup below.
+num_to_keep = NUM_SIMULATIONS_TO_SHOW * 2
+viable_idx = np.flatnonzero(viable)
+candidates = viable_idx
+if len(candidates) > num_to_keep:
+    cutoff = np.partition(differences[candidates], num_to_keep - 1)[num_to_keep - 1]
+    candidates = candidates[differences[candidates] <= cutoff]
+top_rows = candidates[np.lexsort((candidates, differences[candidates]))[:num_to_keep]]
+top_configs = list(map(TeamConfig, differences[top_rows].tolist(), top_rows.tolist(),
+                       roster_masks_a[top_rows].tolist(), strengths_a[top_rows].tolist(),
+                       strengths_b[top_rows].tolist()))
+
+# After pruning, only the evaluated combinations were checked, so the count is not a total
+print(f"Found {len(viable_idx)} positionally viable combinations{' among those evaluated' if pruned else ''} "
+      f"(for {TARGET_FIELD_FORMATION} field setup).")
 
 
 # 4. Display the Top N Viable Simulations
@@ -295,22 +507,21 @@ print(f"\n--- Displaying the top {NUM_SIMULATIONS_TO_SHOW} most balanced & viabl
 displayed_configs_set = set()
 count_shown = 0
 
-for i, config in enumerate(viable_configs):
+for i, config in enumerate(top_configs):
     if count_shown >= NUM_SIMULATIONS_TO_SHOW:
         break
 
-    # Create unique identifiers for the pair of teams (order doesn't matter)
-    team_a_names = frozenset(p['name'] for p in config['team_a'])
-    team_b_names = frozenset(p['name'] for p in config['team_b'])
-    config_identifier = tuple(sorted((team_a_names, team_b_names)))
+    # Unique identifier for the pair of teams (order doesn't matter): the smaller of the two roster masks
+    mask_a = config.mask_a
+    config_identifier = min(mask_a, full_roster_mask ^ mask_a)
 
     if config_identifier not in displayed_configs_set:
         print(f"\n--- Simulation {count_shown + 1} (Rank {i+1} overall viable) ---")
-        print(f"Strength Balance Difference: {config['difference']}")
-        print(f"\nTeam A (Strength: {config['strength_a']}, Viable: Yes)")
-        print(f"  {format_team(config['team_a'])}")
-        print(f"\nTeam B (Strength: {config['strength_b']}, Viable: Yes)")
-        print(f"  {format_team(config['team_b'])}")
+        print(f"Strength Balance Difference: {config.difference}")
+        print(f"\nTeam A (Strength: {config.strength_a}, Viable: Yes)")
+        print(f"  {format_team(team_from_mask(mask_a))}")
+        print(f"\nTeam B (Strength: {config.strength_b}, Viable: Yes)")
+        print(f"  {format_team(team_from_mask(full_roster_mask ^ mask_a))}")
         print("-" * 30)
 
         displayed_configs_set.add(config_identifier)
@@ -323,13 +534,14 @@ elif count_shown < NUM_SIMULATIONS_TO_SHOW:
 
 
 # 5. Visualize the Best Simulation
-if viable_configs:
-    best_config = viable_configs[0]
+if top_configs:
+    best_config = top_configs[0]
     print("\n--- Visualizing the BEST balanced and viable teams ---")
 
     # Assign players to roles for plotting
-    team_a_assigned = assign_positions_for_plot(best_config['team_a'], TARGET_FIELD_FORMATION)
-    team_b_assigned = assign_positions_for_plot(best_config['team_b'], TARGET_FIELD_FORMATION)
+    team_a_assigned = assign_positions_for_plot(team_from_mask(best_config.mask_a), TARGET_FIELD_FORMATION)
+    team_b_assigned = assign_positions_for_plot(team_from_mask(full_roster_mask ^ best_config.mask_a),
+                                                TARGET_FIELD_FORMATION)
 
     # Plot
     plot_formation(team_a_assigned, team_b_assigned, best_config)